@@ -1,12 +1,18 @@
 import os
 import csv
+import fcntl
 import tempfile
-from flask import Flask, request, render_template, redirect, url_for, flash, session
+import threading
+import time
+from flask import Flask, request, render_template, redirect, url_for, flash, session, jsonify
 import json
 from werkzeug.utils import secure_filename
 import requests
 import xml.etree.ElementTree as ET
-from gdrive_helper import download_tsv_from_gdrive, upload_tsv_to_gdrive
+from gdrive_helper import download_tsv_from_gdrive, upload_tsv_to_gdrive, download_mirror_from_gdrive, upload_mirror_to_gdrive
+import bgg_mirror
+from facets import FacetIndex, FACET_LABELS
+from autocomplete import AutocompleteIndex, SUGGEST_FIELDS
 from google import genai
 from google.genai import types
 import string
@@ -19,26 +25,56 @@ SITE_PASSWORD = os.getenv("SITE_PASSWORD", "letmein")
 
 # Temporary local TSV file - sync to Google Drive for persistence
 TSV_FILE = 'boardgames.tsv'
+# Serializes local TSV reads/writes between request handlers and the BGG refresher thread
+tsv_lock = threading.RLock()
 
 # Gemini API Setup (You will plug your key here)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 BEARER_TOKEN = os.getenv("bearer_token")
 
+# Facet counts over the collection, updated incrementally whenever the TSV is loaded or saved
+facet_index = FacetIndex()
+SEARCH_FACET_LIMIT = 10  # values shown per facet next to search results
+
+# Typeahead over the local TSV for the search form
+autocomplete_index = AutocompleteIndex(TSV_FILE)
+
+# Background refresh of the BGG mirror
+BGG_REFRESH_INTERVAL = int(os.getenv("BGG_REFRESH_INTERVAL", 24 * 3600))  # seconds between passes, 0 disables
+BGG_REFRESH_STARTUP_DELAY = int(os.getenv("BGG_REFRESH_STARTUP_DELAY", 60))  # seconds before the first pass
+BGG_REFRESHER_LOCK_FILE = 'bgg_refresher.lock'  # only the process holding this runs the refresher
+bgg_refresher_lock = None  # open lock file, kept for the life of the process that won it
+BGG_BATCH_SIZE = 20  # ids per thing request
+BGG_REQUEST_DELAY = float(os.getenv("BGG_REQUEST_DELAY", 5))  # seconds between batched requests
+
+# Columns copied from BGG that a refresh may update (Title and Notes are left alone)
+BGG_FIELDS = ['MinPlayers', 'MaxPlayers', 'Publisher', 'Designer', 'Weight', 'MinPlaytime', 'MaxPlaytime', 'Mechanics', 'IsExpansion']
+# Columns that drift on BGG by themselves (community votes), so they follow BGG even for rows never mirrored
+BGG_LIVE_FIELDS = ['Weight']
+
 def load_tsv():
-    if not os.path.exists(TSV_FILE):
-        return []
-    with open(TSV_FILE, newline='', encoding='utf-8') as f:
-        return list(csv.DictReader(f, delimiter='\t'))
+    with tsv_lock:
+        if not os.path.exists(TSV_FILE):
+            return []
+        with open(TSV_FILE, newline='', encoding='utf-8') as f:
+            games = list(csv.DictReader(f, delimiter='\t'))
+    facet_index.update(games)
+    return games
 
 def save_tsv(games):
     fieldnames = ['ID', 'Title', 'MinPlayers', 'MaxPlayers', 'Publisher', 'Designer', 'Weight', 'MinPlaytime', 'MaxPlaytime', 'Mechanics', 'IsExpansion', 'Notes']
-    with open(TSV_FILE, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter='\t')
-        writer.writeheader()
-        for game in games:
-            writer.writerow(game)
-    upload_tsv_to_gdrive()
+    with tsv_lock:
+        # Write to a temp file first so a concurrent reader never sees a half-written TSV
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(TSV_FILE)))
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter='\t')
+            writer.writeheader()
+            for game in games:
+                writer.writerow(game)
+        os.replace(tmp_file, TSV_FILE)
+        upload_tsv_to_gdrive()
+    facet_index.update(games)
 
 def extract_titles_from_image(image_path):
     client = genai.Client(api_key=GEMINI_API_KEY, http_options={'api_version': 'v1alpha'})
@@ -125,10 +161,10 @@ def search_bgg_games(title):
                 })
     return matches
 
-def get_bgg_game_details(game_id):
-    """Fetch detailed info for a BGG game by ID using get_values helper"""
+def fetch_bgg_game_details(game_ids):
+    """Fetch detailed info for several BGG games with a single thing request"""
     url = "https://boardgamegeek.com/xmlapi2/thing"
-    params = {'id': game_id, 'stats': 1}
+    params = {'id': ",".join(str(game_id) for game_id in game_ids), 'stats': 1}
 
     headers = {
         "Authorization": f"Bearer {BEARER_TOKEN}"
@@ -139,9 +175,24 @@ def get_bgg_game_details(game_id):
         return None
 
     root = ET.fromstring(r.content)
-    item = root.find('item')
-    if item is None:
-        return None
+    return [parse_bgg_item(item) for item in root.findall('item')]
+
+def get_bgg_game_details(game_id):
+    """Return details for a BGG game, reading the local mirror before going to BGG"""
+    details = bgg_mirror.get_game(game_id, max_age=bgg_mirror.MAX_AGE)
+    if details:
+        return details
+
+    fetched = fetch_bgg_game_details([game_id])
+    if not fetched:
+        # BGG unavailable: an old mirror entry is better than nothing
+        return bgg_mirror.get_game(game_id)
+    bgg_mirror.put_games(fetched)
+    return fetched[0]
+
+def parse_bgg_item(item):
+    """Build a TSV row from a BGG thing <item> using get_values helper"""
+    game_id = item.attrib.get('id')
 
     # Helper to safely extract 'value' attribute
     def get_attr_value(tag):
@@ -199,6 +250,100 @@ def get_bgg_game_details(game_id):
         "Notes": notes
     }
 
+def refresh_bgg_mirror():
+    """Re-fetch stale mirror entries in batches and apply BGG changes to the collection in one write
+
+    A column follows BGG when it is empty, or when it still holds a BGG value the row was saved
+    with (the mirror's applied history); any other value is a manual edit and is left alone.
+    Columns with no recorded history only follow BGG if they are in BGG_LIVE_FIELDS.
+    """
+    with tsv_lock:
+        download_tsv_from_gdrive()
+        game_ids = [g['ID'] for g in load_tsv() if g.get('ID')]
+    stale = bgg_mirror.stale_ids(game_ids)
+
+    refreshed = {}
+    for start in range(0, len(stale), BGG_BATCH_SIZE):
+        if start:
+            time.sleep(BGG_REQUEST_DELAY)
+        batch = fetch_bgg_game_details(stale[start:start + BGG_BATCH_SIZE])
+        if batch is None:
+            break  # rate limited or BGG unavailable, the rest stays stale until the next pass
+        bgg_mirror.put_games(batch)
+        refreshed.update({details['ID']: details for details in batch})
+
+    changed = 0
+    # Reload right before writing, holding the lock, so games added while fetching are kept
+    with tsv_lock:
+        download_tsv_from_gdrive()
+        games = load_tsv()
+        compared = []
+        for game in games:
+            new = refreshed.get(game.get('ID'))
+            if not new:
+                continue
+            compared.append((game, new))
+            applied = bgg_mirror.get_applied(game['ID'])
+            updated = False
+            for field in BGG_FIELDS:
+                current = game.get(field, '')
+                if current == new[field]:
+                    continue
+                if not current or current in applied.get(field, []) or (field not in applied and field in BGG_LIVE_FIELDS):
+                    game[field] = new[field]
+                    updated = True
+            changed += updated
+
+        if changed:
+            save_tsv(games)
+        # Only now that the rows are saved do their BGG values become the baseline
+        bgg_mirror.mark_applied(compared, BGG_FIELDS)
+
+    if refreshed:
+        upload_mirror_to_gdrive()
+    return changed
+
+def start_bgg_refresher():
+    """Start the refresher thread in one process only
+
+    Called from the gunicorn post_worker_init hook (gunicorn.conf.py), not on import, so
+    scripts, tests and flask shell don't start it. Every worker calls this; the flock picks one.
+    """
+    global bgg_refresher_lock
+    if BGG_REFRESH_INTERVAL <= 0:
+        return
+    lock_file = open(BGG_REFRESHER_LOCK_FILE, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return  # another worker already runs it
+    bgg_refresher_lock = lock_file
+
+    def run():
+        # Pick up the mirror persisted in Drive, since the local copy does not survive a redeploy
+        try:
+            download_mirror_from_gdrive()
+        except Exception as e:
+            print(f"BGG mirror download failed: {e}")
+
+        time.sleep(BGG_REFRESH_STARTUP_DELAY)
+        while True:
+            try:
+                changed = refresh_bgg_mirror()
+                print(f"BGG mirror refresh updated {changed} game(s)")
+            except Exception as e:
+                print(f"BGG mirror refresh failed: {e}")
+            time.sleep(BGG_REFRESH_INTERVAL)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def apply_refinements(games):
+    """Narrow games by the facet refinements stored in the session"""
+    for facet, value in session.get('refinements', []):
+        games = [g for g in games if facet_index.matches(g, facet, value)]
+    return games
+
 def sort_games(games, sort_by):
     key_funcs = {
         'title': lambda g: g.get('Title', '').lower(),
@@ -245,6 +390,9 @@ def index():
     else:
         games = load_tsv()
         searched = False
+    if session.get('refinements'):
+        games = apply_refinements(games)
+        searched = True
 
     if sort_by:
         if sort_by == 'title':
@@ -258,7 +406,9 @@ def index():
         elif sort_by == 'notes':
             games.sort(key=lambda g: g['Notes'].lower() if g['Notes'] else '')
 
-    return render_template('index.html', games=games, searched=searched, sort_by=sort_by)
+    facets = facet_index.facet_counts(games, limit=SEARCH_FACET_LIMIT) if searched else None
+    return render_template('index.html', games=games, searched=searched, sort_by=sort_by,
+                           facets=facets, facet_labels=FACET_LABELS)
 
 
 @app.route('/upload-image', methods=['POST'])
@@ -395,14 +545,17 @@ def confirm_add_all():
         games = load_tsv()
         existing_titles = {g['Title'].lower() for g in games}
         newly_added = 0
+        added = []
         for game_id in selected_game_ids:
             details = get_bgg_game_details(game_id)
             if details and details['Title'].lower() not in existing_titles:
                 games.insert(0, details)
                 newly_added += 1
+                added.append((details, details))
                 existing_titles.add(details['Title'].lower())
 
         save_tsv(games)
+        bgg_mirror.mark_applied(added, BGG_FIELDS)
         flash(f"Added {newly_added} new games to the database.", "success")
 
         # Clear session data
@@ -476,6 +629,7 @@ def confirm_add():
         else:
             games.insert(0, details)
             save_tsv(games)
+            bgg_mirror.mark_applied([(details, details)], BGG_FIELDS)
             flash(f"Added '{details['Title']}' to the database.", "success")
 
         return redirect(url_for('index'))
@@ -566,8 +720,11 @@ def search():
 
         # Store filtered results in session for consistency
         session['search_results'] = json.dumps(filtered)
+        session.pop('refinements', None)
 
-        return render_template('index.html', games=filtered, sort_by=sort_by, searched=True)
+        facets = facet_index.facet_counts(filtered, limit=SEARCH_FACET_LIMIT)
+        return render_template('index.html', games=filtered, sort_by=sort_by, searched=True,
+                               facets=facets, facet_labels=FACET_LABELS)
 
     # GET request shows all games
     sort_by = request.args.get('sort')
@@ -576,11 +733,28 @@ def search():
         searched = True
     else:
         searched = False
+    if session.get('refinements'):
+        games = apply_refinements(games)
+        searched = True
 
     if sort_by:
         games = sort_games(games, sort_by)
 
-    return render_template('index.html', games=games, sort_by=sort_by, searched=searched)
+    facets = facet_index.facet_counts(games, limit=SEARCH_FACET_LIMIT) if searched else None
+    return render_template('index.html', games=games, sort_by=sort_by, searched=searched,
+                           facets=facets, facet_labels=FACET_LABELS)
+
+@app.route('/autocomplete')
+def autocomplete():
+    """Suggest values for a search field from what is already in the collection"""
+    if not session.get('logged_in'):
+        return jsonify([]), 401
+    field = request.args.get('field', 'title')
+    if field not in SUGGEST_FIELDS:
+        return jsonify([]), 400
+
+    # Reads the local TSV only; a Drive download per keystroke would defeat the index
+    return jsonify(autocomplete_index.suggest(field, request.args.get('q', '')))
 
 @app.route('/edit/<title>', methods=['GET', 'POST'])
 def edit(title):
@@ -629,6 +803,44 @@ def delete_game(game_id):
 @app.route('/clear')
 def clear():
     session.pop('search_results', None)
+    session.pop('refinements', None)
+    return redirect(url_for('index'))
+
+@app.route('/stats')
+def stats():
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    download_tsv_from_gdrive()
+    games = load_tsv()
+
+    return render_template('stats.html', total=len(games), facets=facet_index.facet_counts(),
+                           facet_labels=FACET_LABELS)
+
+@app.route('/refine')
+def refine():
+    """Narrow the current results to games with one facet value; scope=all starts from the whole collection
+
+    Only the facet/value pairs go in the session (the cookie is too small for the rows);
+    index() applies them to the TSV or the stored search results.
+    """
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    facet = request.args.get('facet', '')
+    value = request.args.get('value', '')
+    if facet not in FACET_LABELS or not value:
+        flash("Unknown refinement.", "error")
+        return redirect(url_for('index'))
+
+    if request.args.get('scope') == 'all':
+        session.pop('search_results', None)
+        session['refinements'] = []
+    refinements = session.get('refinements', [])
+    if [facet, value] not in refinements:
+        refinements.append([facet, value])
+    session['refinements'] = refinements
+    session.modified = True
+
+    flash(f"Refined to {FACET_LABELS[facet]}: {value}.", "info")
     return redirect(url_for('index'))
 
 @app.route('/search-by-image', methods=['POST'])
@@ -663,7 +875,13 @@ def search_by_image():
     if not results:
         flash("No matching games found for detected titles", "info")
 
-    return render_template('index.html', games=results, searched=True)
+    # Store results like search() does, so refine links narrow these games
+    session['search_results'] = json.dumps(results)
+    session.pop('refinements', None)
+
+    facets = facet_index.facet_counts(results, limit=SEARCH_FACET_LIMIT)
+    return render_template('index.html', games=results, searched=True,
+                           facets=facets, facet_labels=FACET_LABELS)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,103 @@
+import bisect
+import csv
+import hashlib
+import io
+import os
+import threading
+
+from facets import split_tokens
+
+# Search form field -> TSV column; columns in TOKEN_COLUMNS are comma-joined lists
+SUGGEST_FIELDS = {'title': 'Title', 'publisher': 'Publisher', 'designer': 'Designer', 'mechanics': 'Mechanics'}
+TOKEN_COLUMNS = {'Publisher', 'Designer', 'Mechanics'}
+SUGGEST_LIMIT = 10
+
+def normalize(text):
+    return " ".join((text or '').lower().split())
+
+class PrefixIndex:
+    """Sorted keys searched with bisect; every word start of a value is a key, so 'cat' finds 'Settlers of Catan'"""
+
+    def __init__(self, values):
+        entries = set()
+        for value in values:
+            words = normalize(value).split()
+            for i in range(len(words)):
+                entries.add((" ".join(words[i:]), value))
+        entries = sorted(entries)
+        self._keys = [key for key, _ in entries]
+        self._values = [value for _, value in entries]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        for i in range(bisect.bisect_left(self._keys, prefix), len(self._keys)):
+            if not self._keys[i].startswith(prefix):
+                break
+            value = self._values[i]
+            if value not in seen:
+                seen.add(value)
+                results.append(value)
+                if len(results) == limit:
+                    break
+        return results
+
+class AutocompleteIndex:
+    """Prefix indexes over the local TSV, rebuilt only when its contents change
+
+    Lookups only stat the file; it is re-read when its mtime or size moves, and the
+    indexes are rebuilt only if the content hash differs (a Drive download rewrites
+    the file on every page load even when nothing changed).
+    """
+
+    def __init__(self, tsv_file):
+        self.tsv_file = tsv_file
+        self._lock = threading.Lock()
+        self._stat = None
+        self._digest = None
+        self._indexes = {field: PrefixIndex([]) for field in SUGGEST_FIELDS}
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.tsv_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self):
+        stat = self._file_stat()
+        if stat == self._stat:
+            return
+        with self._lock:
+            if stat == self._stat:
+                return
+            data = b''
+            if stat is not None:
+                with open(self.tsv_file, 'rb') as f:
+                    data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if digest != self._digest:
+                self._indexes = self._build(data)
+                self._digest = digest
+            self._stat = stat
+
+    def _build(self, data):
+        games = list(csv.DictReader(io.StringIO(data.decode('utf-8')), delimiter='\t')) if data else []
+        indexes = {}
+        for field, column in SUGGEST_FIELDS.items():
+            if column in TOKEN_COLUMNS:
+                values = {token for g in games for token in split_tokens(g.get(column))}
+            else:
+                values = {g[column] for g in games if g.get(column)}
+            indexes[field] = PrefixIndex(values)
+        return indexes
+
+    def suggest(self, field, prefix, limit=SUGGEST_LIMIT):
+        self._refresh()
+        return self._indexes[field].suggest(prefix, limit)
@@ -0,0 +1,119 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Local mirror of BGG 'thing' details, keyed by BGG ID
+MIRROR_FILE = 'bgg_mirror.json'
+MIRROR_LOCK_FILE = MIRROR_FILE + '.lock'  # serializes read-merge-write between worker processes
+MAX_AGE = int(os.getenv("BGG_MIRROR_MAX_AGE", 7 * 24 * 3600))  # seconds before an entry is stale
+APPLIED_HISTORY = 5  # applied BGG values remembered per column
+
+# Each entry holds:
+#   details    - the latest BGG fetch, used as a lookup cache
+#   fetched_at - when details was fetched
+#   applied    - per column, the BGG values the collection row has been saved with (newest last).
+#                Only updated after the TSV is saved, so it is the refresher's baseline for
+#                telling BGG values from manual edits.
+
+_lock = threading.Lock()
+_entries = {}
+_stat = None
+
+def _file_stat():
+    try:
+        st = os.stat(MIRROR_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _load():
+    """Return the entries, re-reading the file if another process (or a Drive download) replaced it"""
+    global _entries, _stat
+    stat = _file_stat()
+    if stat != _stat:
+        if stat is None:
+            _entries = {}
+        else:
+            with open(MIRROR_FILE, encoding='utf-8') as f:
+                _entries = json.load(f)
+        _stat = stat
+    return _entries
+
+def _save(entries):
+    global _stat
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(MIRROR_FILE)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(entries, f)
+    os.replace(tmp_file, MIRROR_FILE)
+    _stat = _file_stat()
+
+@contextmanager
+def _update():
+    """Yield the current entries for modification, then write them back
+
+    The file is re-read under an flock first, so entries written by other worker processes are kept.
+    """
+    with _lock, open(MIRROR_LOCK_FILE, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        entries = _load()
+        yield entries
+        _save(entries)
+
+def get_game(game_id, max_age=None):
+    """Return mirrored details for a BGG game, or None if it has never been fetched or is older than max_age"""
+    with _lock:
+        entry = _load().get(str(game_id))
+        if not entry:
+            return None
+        if max_age is not None and entry['fetched_at'] < time.time() - max_age:
+            return None
+        return dict(entry['details'])
+
+def get_applied(game_id):
+    """Return {column: [BGG values the row was saved with]} for a game, empty if nothing was recorded"""
+    with _lock:
+        entry = _load().get(str(game_id))
+        return {field: list(values) for field, values in (entry or {}).get('applied', {}).items()}
+
+def put_games(games):
+    """Store freshly fetched details for one or more games, keeping their applied baselines"""
+    now = time.time()
+    with _update() as entries:
+        for details in games:
+            entry = entries.setdefault(str(details['ID']), {})
+            entry['details'] = details
+            entry['fetched_at'] = now
+
+def mark_applied(pairs, fields):
+    """Record the BGG values that were just saved to the collection
+
+    pairs is a list of (saved row, BGG details it was compared against). Call only after the
+    TSV write succeeded; every column where the row equals the BGG value joins that game's
+    applied history.
+    """
+    with _update() as entries:
+        for row, details in pairs:
+            entry = entries.get(str(details['ID']))
+            if not entry:
+                continue
+            applied = entry.setdefault('applied', {})
+            for field in fields:
+                value = details.get(field)
+                if row.get(field) != value:
+                    continue
+                history = [v for v in applied.get(field, []) if v != value] + [value]
+                applied[field] = history[-APPLIED_HISTORY:]
+
+def stale_ids(game_ids, max_age=MAX_AGE):
+    """Return the IDs that are missing from the mirror or older than max_age"""
+    cutoff = time.time() - max_age
+    with _lock:
+        entries = _load()
+        return [
+            str(game_id) for game_id in dict.fromkeys(game_ids)
+            if str(game_id) not in entries or entries[str(game_id)]['fetched_at'] < cutoff
+        ]
@@ -0,0 +1,144 @@
+import threading
+from collections import Counter
+
+# Facets built from the comma-joined columns
+TOKEN_FACETS = {'mechanic': 'Mechanics', 'designer': 'Designer', 'publisher': 'Publisher'}
+
+# Histogram facets, with their buckets in display order
+WEIGHT_BUCKETS = ['1.0–1.5', '1.5–2.0', '2.0–2.5', '2.5–3.0', '3.0–3.5', '3.5–4.0', '4.0–4.5', '4.5–5.0']
+PLAYTIME_BUCKETS = [(30, '≤30 min'), (60, '31–60 min'), (90, '61–90 min'), (120, '91–120 min'), (None, '120+ min')]
+MAX_PLAYER_COUNT = 8  # player counts from here up share one bucket
+PLAYER_BUCKETS = [str(n) for n in range(1, MAX_PLAYER_COUNT)] + [f'{MAX_PLAYER_COUNT}+']
+
+HISTOGRAM_FACETS = {
+    'weight': WEIGHT_BUCKETS,
+    'playtime': [label for _, label in PLAYTIME_BUCKETS],
+    'players': PLAYER_BUCKETS,
+}
+
+FACET_LABELS = {
+    'mechanic': 'Mechanics',
+    'designer': 'Designers',
+    'publisher': 'Publishers',
+    'weight': 'Weight',
+    'playtime': 'Playtime',
+    'players': 'Player count',
+}
+
+# Columns a profile is built from; a row is re-profiled only when one of these changes
+PROFILE_COLUMNS = ['Mechanics', 'Designer', 'Publisher', 'Weight', 'MinPlaytime', 'MaxPlaytime', 'MinPlayers', 'MaxPlayers']
+
+def split_tokens(value):
+    return [token.strip() for token in (value or '').split(',') if token.strip()]
+
+def to_number(value, cast=int):
+    """Parse a positive number; missing, garbage and non-positive values are None"""
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+def weight_bucket(value):
+    weight = to_number(value, float)
+    if weight is None:
+        return []
+    index = min(max(int((weight - 1.0) // 0.5), 0), len(WEIGHT_BUCKETS) - 1)
+    return [WEIGHT_BUCKETS[index]]
+
+def playtime_bucket(min_value, max_value):
+    playtime = to_number(max_value) or to_number(min_value)
+    if playtime is None:
+        return []
+    for limit, label in PLAYTIME_BUCKETS:
+        if limit is None or playtime <= limit:
+            return [label]
+
+def player_buckets(min_value, max_value):
+    min_players = to_number(min_value)
+    max_players = to_number(max_value) or min_players
+    if min_players is None:
+        return []
+    low = min(min_players, MAX_PLAYER_COUNT)
+    high = min(max(max_players, min_players), MAX_PLAYER_COUNT)
+    return PLAYER_BUCKETS[low - 1:high]
+
+def game_profile(game):
+    """Split a TSV row into the facet values it counts towards"""
+    profile = {facet: split_tokens(game.get(column)) for facet, column in TOKEN_FACETS.items()}
+    profile['weight'] = weight_bucket(game.get('Weight'))
+    profile['playtime'] = playtime_bucket(game.get('MinPlaytime'), game.get('MaxPlaytime'))
+    profile['players'] = player_buckets(game.get('MinPlayers'), game.get('MaxPlayers'))
+    return profile
+
+def row_key(game):
+    """Identify a row by ID, Title and profiled columns, so an edited row is a new key and duplicates share one"""
+    return (game.get('ID', ''), game.get('Title', '')) + tuple(game.get(column, '') for column in PROFILE_COLUMNS)
+
+class FacetIndex:
+    """Facet counts over the collection, kept up to date by diffing each loaded TSV against the last one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}  # row key -> (profile, number of rows with that key)
+        self._counts = {facet: Counter() for facet in FACET_LABELS}
+
+    def _apply(self, profile, delta):
+        for facet, values in profile.items():
+            counts = self._counts[facet]
+            for value in values:
+                counts[value] += delta
+                if counts[value] <= 0:
+                    del counts[value]
+
+    def update(self, games):
+        """Bring the counts in line with games, profiling only rows that were added or edited
+
+        Duplicate rows are counted once each, matching len(games).
+        """
+        with self._lock:
+            wanted = Counter(row_key(game) for game in games)
+            for key in set(self._rows) - set(wanted):
+                profile, count = self._rows.pop(key)
+                self._apply(profile, -count)
+
+            for game in games:
+                key = row_key(game)
+                count = wanted[key]
+                current = self._rows.get(key)
+                if current and current[1] == count:
+                    continue
+                profile = current[0] if current else game_profile(game)
+                self._apply(profile, count - (current[1] if current else 0))
+                self._rows[key] = (profile, count)
+
+    def profile(self, game):
+        """Return the cached profile for a row, or build one if the row is new or edited"""
+        current = self._rows.get(row_key(game))
+        return current[0] if current else game_profile(game)
+
+    def facet_counts(self, games=None, limit=None):
+        """Return {facet: [(value, count), ...]} for the whole collection, or for a subset such as search results
+
+        Token facets are ordered by count, histograms by bucket. limit caps the token facets.
+        """
+        if games is None:
+            with self._lock:
+                counts = {facet: Counter(values) for facet, values in self._counts.items()}
+        else:
+            counts = {facet: Counter() for facet in FACET_LABELS}
+            for game in games:
+                for facet, values in self.profile(game).items():
+                    counts[facet].update(values)
+
+        result = {}
+        for facet in FACET_LABELS:
+            if facet in HISTOGRAM_FACETS:
+                result[facet] = [(bucket, counts[facet][bucket]) for bucket in HISTOGRAM_FACETS[facet]]
+            else:
+                ranked = sorted(counts[facet].items(), key=lambda item: (-item[1], item[0].lower()))
+                result[facet] = ranked[:limit] if limit else ranked
+        return result
+
+    def matches(self, game, facet, value):
+        return value in self.profile(game).get(facet, [])
@@ -3,32 +3,61 @@ from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
 from google.oauth2 import service_account
 import io
 import os
+import tempfile
 
 # Configuration
 CREDENTIALS_FILE = 'credentials.json'
 SCOPES = ['https://www.googleapis.com/auth/drive']
 TSV_FILENAME = 'boardgames.tsv'
 DRIVE_FILE_ID = os.getenv("DRIVE_TSV_FILE_ID")  # ID of file in Google Drive
+MIRROR_FILENAME = 'bgg_mirror.json'
+DRIVE_MIRROR_FILE_ID = os.getenv("DRIVE_MIRROR_FILE_ID")  # ID of the BGG mirror file in Google Drive
 
 def get_drive_service():
     creds = service_account.Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
     return build('drive', 'v3', credentials=creds)
 
-def download_tsv_from_gdrive():
-    """Download TSV file from Google Drive"""
+def download_from_gdrive(filename, file_id):
+    """Download a file from Google Drive, replacing the local copy in one step"""
     service = get_drive_service()
-    request = service.files().get_media(fileId=DRIVE_FILE_ID)
-    fh = io.FileIO(TSV_FILENAME, 'wb')
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
+    request = service.files().get_media(fileId=file_id)
+    # Write to a unique temp file first so readers never see a half-written file
+    # and overlapping downloads don't share one
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with io.FileIO(fd, 'wb') as fh:
+            downloader = MediaIoBaseDownload(fh, request)
+            done = False
+            while not done:
+                status, done = downloader.next_chunk()
+        os.replace(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
 
-def upload_tsv_to_gdrive():
-    """Upload TSV file to Google Drive (overwrite)"""
+def upload_to_gdrive(filename, file_id, mimetype):
+    """Upload a file to Google Drive (overwrite)"""
     service = get_drive_service()
-    media = MediaIoBaseUpload(io.FileIO(TSV_FILENAME, 'rb'), mimetype='text/tab-separated-values')
+    media = MediaIoBaseUpload(io.FileIO(filename, 'rb'), mimetype=mimetype)
     service.files().update(
-        fileId=DRIVE_FILE_ID,
+        fileId=file_id,
         media_body=media
     ).execute()
+
+def download_tsv_from_gdrive():
+    """Download TSV file from Google Drive"""
+    download_from_gdrive(TSV_FILENAME, DRIVE_FILE_ID)
+
+def upload_tsv_to_gdrive():
+    """Upload TSV file to Google Drive (overwrite)"""
+    upload_to_gdrive(TSV_FILENAME, DRIVE_FILE_ID, 'text/tab-separated-values')
+
+def download_mirror_from_gdrive():
+    """Download the BGG mirror from Google Drive, if a Drive file is configured"""
+    if DRIVE_MIRROR_FILE_ID:
+        download_from_gdrive(MIRROR_FILENAME, DRIVE_MIRROR_FILE_ID)
+
+def upload_mirror_to_gdrive():
+    """Upload the BGG mirror to Google Drive (overwrite), if a Drive file is configured"""
+    if DRIVE_MIRROR_FILE_ID:
+        upload_to_gdrive(MIRROR_FILENAME, DRIVE_MIRROR_FILE_ID, 'application/json')
@@ -0,0 +1,4 @@
+def post_worker_init(worker):
+    # Start the BGG mirror refresher explicitly rather than on import; only one worker wins its lock
+    from app import start_bgg_refresher
+    start_bgg_refresher()